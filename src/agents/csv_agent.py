@@ -1,27 +1,30 @@
 from langchain_experimental.agents import create_csv_agent
-from langchain_openai import ChatOpenAI
 from src.config.index import appConfig
+from src.services.llm import get_chat_model
 
-def create_project_csv_agent(file_paths: list[str], model_name: str = "gpt-4o"):
+def create_project_csv_agent(
+    file_paths: list[str],
+    model_name: str = "gpt-4o",
+    sample_rows: int | None = appConfig["agent_sample_rows"],
+):
     """
     Creates a CSV agent for handling structured data (CSV, Excel).
     
     Args:
         file_paths: List of absolute paths to the CSV/Excel files.
         model_name: The OpenAI model to use.
+        sample_rows: If set, only the first N rows of each file are loaded (faster startup on
+            big files, but answers are computed on that sample). Defaults to AGENT_SAMPLE_ROWS.
         
     Returns:
         An agent executor ready to be invoked.
     """
-    llm = ChatOpenAI(
-        model=model_name,
-        api_key=appConfig["openai_api_key"],
-        temperature=0
-    )
+    llm = get_chat_model(model_name)
 
     return create_csv_agent(
         llm,
         file_paths,
-        verbose=True,
+        pandas_kwargs={"nrows": sample_rows} if sample_rows else None,
+        verbose=appConfig["debug"],  # verbose prints every step and DataFrame repr to stdout
         allow_dangerous_code=True,
     )
@@ -1,76 +1,521 @@
+import asyncio
+import csv
+import glob
+import hashlib
 import json
+import logging
+import os
+import queue
+import re
 import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
+from openpyxl import load_workbook
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterator, Iterator
+from langchain_openai import OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from src.config.index import appConfig
+from src.services.llm import get_chat_model, openai_http_client, openai_http_async_client
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    LRU cache for deterministic (temperature=0) LLM responses.
+
+    Exact hits are looked up by a SHA256 key. Optionally, a semantic tier keeps
+    normalized query embeddings per namespace so paraphrased queries can reuse
+    a previous response when their cosine similarity is above the threshold.
+    """
+
+    def __init__(self, maxsize: int = 512, similarity_threshold: float = 0.92):
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        # namespace -> (embeddings matrix, cache key for each row)
+        self._vectors: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+
+    @staticmethod
+    def cache_key(model: str, messages: Any, temperature: float = 0, tools: Any = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "tools": tools},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Any:
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_similar(self, namespace: str, embedding: np.ndarray) -> Any:
+        """Returns the cached value of the most similar prior query, if above the threshold."""
+        if namespace not in self._vectors:
+            return None
+        embeddings, keys = self._vectors[namespace]
+        scores = embeddings @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        # The exact entry may already have been evicted from the LRU
+        return self.get(keys[best])
+
+    def clear(self):
+        self._entries.clear()
+        self._vectors.clear()
+
+    def add_embedding(self, namespace: str, embedding: np.ndarray, key: str):
+        if namespace in self._vectors:
+            embeddings, keys = self._vectors[namespace]
+            embeddings = np.vstack([embeddings, embedding])[-self.maxsize:]
+            keys = (keys + [key])[-self.maxsize:]
+        else:
+            embeddings, keys = embedding[np.newaxis, :], [key]
+        self._vectors[namespace] = (embeddings, keys)
+
+
+# Rows per chunk when ingesting files - bounds peak memory regardless of file size
+INGEST_CHUNK_ROWS = 100_000
+
+# Applied to every SQLite connection: WAL + memory-mapped reads, 200MB page cache
+SQLITE_PRAGMAS = [
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "mmap_size=30000000000",
+    "cache_size=-200000",
+]
+
+# Generated SQL is interrupted once it runs longer than this (checked every SQLITE_PROGRESS_STEPS VM steps)
+QUERY_TIMEOUT_SECONDS = 5.0
+SQLITE_PROGRESS_STEPS = 100_000
+
+# CSV values converted like pd.read_csv does by default: its missing-value markers become NULL
+# (pandas' default na_values) and boolean text becomes 1/0 (how to_sql stores bool columns).
+# Anything else is stored as text and coerced by the NUMERIC column affinity.
+CSV_VALUE_MAP = {
+    **dict.fromkeys(
+        [
+            "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+            "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+        ]
+    ),
+    **dict.fromkeys(["True", "TRUE", "true"], 1),
+    **dict.fromkeys(["False", "FALSE", "false"], 0),
+}
+
+# Per-agent query result cache: number of results kept, and largest result (rows) worth keeping
+RESULT_CACHE_SIZE = 64
+RESULT_CACHE_MAX_ROWS = 10_000
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\n?|```")
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# id(filtered_schema) -> (filtered_schema, serialized). Holding the dict keeps its id from being reused.
+_filtered_schema_strs: "OrderedDict[int, Tuple[Dict, str]]" = OrderedDict()
+
+
+def _dump_filtered_schema(filtered_schema: Dict) -> str:
+    """Compact JSON for a filtered schema, memoized per object (cache hits return the same dict)."""
+    entry = _filtered_schema_strs.get(id(filtered_schema))
+    if entry is not None and entry[0] is filtered_schema:
+        return entry[1]
+    serialized = json.dumps(filtered_schema, separators=(",", ":"))
+    _filtered_schema_strs[id(filtered_schema)] = (filtered_schema, serialized)
+    if len(_filtered_schema_strs) > 128:
+        _filtered_schema_strs.popitem(last=False)
+    return serialized
+
+
+# Shared across agent instances - the agent is rebuilt for every message
+_schema_cache = LLMCache()
+_sql_cache = LLMCache()
+_query_embedding_cache = LLMCache(maxsize=1024)
+
 
 class SmartDataAgent:
-    def __init__(self, file_paths: List[str], schema_json_path: str, model_name: str = "gpt-4o"):
+    def __init__(
+        self,
+        file_paths: List[str],
+        schema_json_path: str,
+        model_name: str = "gpt-4o",
+        semantic_cache: bool = False,
+        filter_model_name: str = "gpt-4o-mini",
+    ):
         self.file_paths = file_paths
         self.schema_json_path = schema_json_path
         self.model_name = model_name
+        self.filter_model_name = filter_model_name
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(
-            model=model_name,
-            api_key=appConfig["openai_api_key"],
-            temperature=0
-        )
+        # Initialize LLM (process-wide instances sharing one connection pool)
+        self.llm = get_chat_model(model_name)
+
+        # Schema filtering is a classification task - a smaller, faster model is enough
+        self.filter_llm = get_chat_model(filter_model_name)
         
         # Load Schema
         with open(schema_json_path, 'r') as f:
             self.schema = json.load(f)
-            
+
+        # Index schema table names once for filename -> table matching
+        self._build_table_name_index()
+
+        # Serialized once so the prompt prefix is byte-identical across calls (provider prompt caching)
+        # Compact separators also trim input tokens on every call
+        self._schema_str = json.dumps(self.schema, separators=(",", ":"), sort_keys=True)
+
+        # Response caches - keyed by schema content, as the schema file is re-downloaded per message
+        self._schema_hash = hashlib.sha256(self._schema_str.encode()).hexdigest()
+        self._cache_namespace = f"{model_name}:{filter_model_name}:{self._schema_hash}"
+        self._schema_cache = _schema_cache
+        self._sql_cache = _sql_cache
+
+        # Optional semantic tier for paraphrased queries
+        self.embeddings = (
+            OpenAIEmbeddings(
+                model="text-embedding-3-small",
+                api_key=appConfig["openai_api_key"],
+                http_client=openai_http_client,
+                http_async_client=openai_http_async_client,
+            )
+            if semantic_cache
+            else None
+        )
+
+        # Tables are loaded once and never written, so results only depend on the SQL text.
+        # Bounded (agents are kept alive across messages) and only small results are kept.
+        self._result_cache = LLMCache(maxsize=RESULT_CACHE_SIZE)
+        # Serializes queries on the shared connection (the progress handler/deadline is per connection)
+        self._query_lock = threading.Lock()
+
         # Initialize Database
-        self.conn = sqlite3.connect(":memory:")
-        self._load_data_to_sqlite()
+        # File-backed and keyed by the input files, so it is reused across agents and processes
+        # and only rebuilt when a file (or the schema table names) change
+        self._db_prefix, self.db_path = self._database_paths()
+        self._load_task = None
+        if os.path.exists(self.db_path):
+            self.conn = self._connect(self.db_path, read_only=True)
+        else:
+            self.conn = None
+            # Build in the background so ingestion overlaps with the schema-filter/SQL LLM calls
+            try:
+                asyncio.get_running_loop()
+                self._load_task = asyncio.create_task(asyncio.to_thread(self._build_database))
+            except RuntimeError:
+                # No running event loop (e.g. scripts/notebooks) - build synchronously
+                self._build_database()
+
+    def _database_paths(self) -> Tuple[str, str]:
+        """
+        Returns (prefix, db_path) for the file-backed database.
+
+        The prefix identifies the set of input files; the version suffix of db_path changes
+        whenever a file's size/mtime or the schema table names change.
+        """
+        paths = sorted(self.file_paths)
+        slot = hashlib.sha256("\n".join(paths).encode()).hexdigest()[:16]
+        stats = []
+        for path in paths:
+            stat = os.stat(path)
+            stats.append([path, stat.st_size, stat.st_mtime_ns])
+        version = hashlib.sha256(json.dumps([stats, self._table_names]).encode()).hexdigest()[:16]
+        prefix = os.path.join(tempfile.gettempdir(), f"nexora_{slot}_")
+        return prefix, f"{prefix}{version}.db"
+
+    @staticmethod
+    def _connect(path: str, read_only: bool = False) -> sqlite3.Connection:
+        # check_same_thread=False: the database is built and queried on worker threads
+        uri = f"file:{quote(path)}" + ("?mode=ro" if read_only else "")
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # Rows support name access without building a dict per row in Python
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    def _build_database(self):
+        """Loads the files into a private temporary database, then atomically publishes it."""
+        build_path = f"{self.db_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self.conn = self._connect(build_path)
+            try:
+                self._load_data_to_sqlite()
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                self.conn.close()
+            os.replace(build_path, self.db_path)
+        except BaseException:
+            for path in (build_path, f"{build_path}-wal", f"{build_path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        # Previous versions for the same set of files are no longer needed
+        for path in glob.glob(f"{self._db_prefix}*"):
+            if not path.startswith(self.db_path) and ".tmp" not in path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        # Read-only: generated SQL must never modify the shared database
+        self.conn = self._connect(self.db_path, read_only=True)
+
+    async def wait_until_loaded(self):
+        """Waits for the background data load; re-raises any ingestion error."""
+        if self._load_task is not None:
+            # Shielded: the agent is shared across requests, so a cancelled caller must not cancel the load
+            await asyncio.shield(self._load_task)
+
+    @property
+    def load_failed(self) -> bool:
+        """True if the background data load was cancelled or raised - the agent can't answer queries."""
+        task = self._load_task
+        return task is not None and task.done() and (task.cancelled() or task.exception() is not None)
+
+    def invalidate(self):
+        """Clears cached query results. Call after any write to the loaded tables."""
+        with self._query_lock:
+            self._result_cache.clear()
+
+    @staticmethod
+    def _unique_columns(header) -> List[str]:
+        """Names blank columns and de-duplicates repeated ones ('a', 'a.1'), like pandas."""
+        columns = []
+        seen = {}
+        for i, name in enumerate(header):
+            name = str(name) if name not in (None, "") else f"Unnamed: {i}"
+            # SQLite column names are case-insensitive
+            key = name.lower()
+            if key in seen:
+                seen[key] += 1
+                name = f"{name}.{seen[key]}"
+            else:
+                seen[key] = 0
+            columns.append(name)
+        return columns
+
+    @classmethod
+    def _iter_csv_batches(cls, path: str) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        Yields a CSV file as (columns, rows) batches of at most INGEST_CHUNK_ROWS rows.
+
+        Uses csv.reader directly - no pandas round-trip. Missing-value markers (as pandas reads them)
+        become NULL and TRUE/FALSE become 1/0; numeric text is converted by SQLite itself, as the
+        columns are created with NUMERIC affinity.
+        """
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+
+            columns = cls._unique_columns(header)
+            width = len(columns)
+            padding = [""] * width
+            batch = []
+            for row in reader:
+                if not row:
+                    continue
+                batch.append(tuple(CSV_VALUE_MAP.get(value, value) for value in (row + padding)[:width]))
+                if len(batch) >= INGEST_CHUNK_ROWS:
+                    yield columns, batch
+                    batch = []
+            if batch:
+                yield columns, batch
+
+    @classmethod
+    def _iter_chunks(cls, path: str) -> Iterator[pd.DataFrame]:
+        """Yields an Excel file as DataFrames of at most INGEST_CHUNK_ROWS rows."""
+        if path.endswith('.xlsx'):
+            # pandas cannot chunk Excel files - stream rows with openpyxl in read-only mode
+            workbook = load_workbook(path, read_only=True, data_only=True)
+            try:
+                rows = workbook.worksheets[0].iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return
+                columns = cls._unique_columns(header)
+                width = len(columns)
+                batch = []
+                for row in rows:
+                    # Read-only mode also returns formatted-but-empty rows - skip blank rows like pd.read_excel
+                    if all(value is None for value in row):
+                        continue
+                    batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+                    if len(batch) >= INGEST_CHUNK_ROWS:
+                        yield pd.DataFrame(batch, columns=columns)
+                        batch = []
+                if batch:
+                    yield pd.DataFrame(batch, columns=columns)
+            finally:
+                workbook.close()
+        else:
+            # Legacy .xls is not supported by openpyxl
+            yield pd.read_excel(path)
+
+    def _build_table_name_index(self):
+        """Lowercases the schema table names once, in schema order, for _resolve_table_name."""
+        self._table_names = []
+        if self.schema and "tables" in self.schema:
+            self._table_names = [table_def["table_name"].lower() for table_def in self.schema["tables"]]
+
+    def _resolve_table_name(self, path: str) -> str:
+        """
+        Maps a file path to a schema table name, falling back to the cleaned filename.
+        The first schema table (in schema order) that matches wins, not the longest one.
+        """
+        # 1. Get simple filename without path and extension
+        simple_filename = path.split('/')[-1].split('\\')[-1].split('.')[0].lower()
+
+        # 2. Match against schema table names
+        for schema_name in self._table_names:
+            # Check partial match: if schema name is in filename (e.g. 'movie' in 'final_movies')
+            # OR if filename is in schema name (e.g. 'movies' in 'movie_data') - less likely
+            if schema_name in simple_filename or simple_filename in schema_name:
+                return schema_name
+
+        # 3. Fallback to cleaned filename if no match
+        return simple_filename
+
+    def _read_one(self, path: str, table_name: str, batches: queue.Queue, cancelled: threading.Event):
+        """Parses one file on a worker thread and hands its batches to the writer."""
+        try:
+            logger.debug("Loading file %s into table '%s'", path, table_name)
+            chunks = self._iter_csv_batches(path) if path.endswith('.csv') else self._iter_chunks(path)
+            for batch in chunks:
+                if cancelled.is_set():
+                    return
+                batches.put((table_name, batch))
+        finally:
+            # None marks this file as finished (successfully or not)
+            batches.put((table_name, None))
+
+    def _write_batch(self, table_name: str, batch, created: set):
+        """Writes one parsed batch; the first batch of a table (re)creates it."""
+        first = table_name not in created
+        created.add(table_name)
+
+        if isinstance(batch, pd.DataFrame):
+            batch.to_sql(table_name, self.conn, index=False, if_exists='replace' if first else 'append')
+            return
+
+        columns, rows = batch
+        table = _quote_identifier(table_name)
+        if first:
+            column_defs = ", ".join(f"{_quote_identifier(col)} NUMERIC" for col in columns)
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"CREATE TABLE {table} ({column_defs})")
+        placeholders = ", ".join("?" * len(columns))
+        self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
 
     def _load_data_to_sqlite(self):
         """Loads CSV/Excel files into SQLite tables matching the schema keys or filenames."""
+        # Only CSV/Excel files are loaded. When several files map to the same table the
+        # last one wins, as with the previous sequential 'replace' loads.
+        table_paths = {}
         for path in self.file_paths:
-            # Detect file type and load accordingly
-            if path.endswith('.csv'):
-                df = pd.read_csv(path)
-            elif path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(path)
-            else:
-                continue
-                
-            # Clean table name logic
-            # 1. Get simple filename without path and extension
-            simple_filename = path.split('/')[-1].split('\\')[-1].split('.')[0].lower()
-            
-            # 2. Match against schema table names
-            matched_table_name = None
-            if self.schema and "tables" in self.schema:
-                for table_def in self.schema["tables"]:
-                    schema_name = table_def["table_name"].lower()
-                    # Check partial match: if schema name is in filename (e.g. 'movie' in 'final_movies')
-                    # OR if filename is in schema name (e.g. 'movies' in 'movie_data') - less likely
-                    if schema_name in simple_filename or simple_filename in schema_name:
-                         matched_table_name = schema_name
-                         break
-            
-            # 3. Fallback to cleaned filename if no match
-            if matched_table_name:
-                table_name = matched_table_name
-            else:
-                table_name = simple_filename
+            if path.endswith(('.csv', '.xlsx', '.xls')):
+                table_paths[self._resolve_table_name(path)] = path
+
+        if table_paths:
+            # Files are parsed in parallel; writes to the (non thread-safe) connection stay on this thread.
+            # The bounded queue keeps memory at a few batches per worker.
+            workers = min(8, len(table_paths))
+            batches = queue.Queue(maxsize=workers)
+            cancelled = threading.Event()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(self._read_one, path, table_name, batches, cancelled)
+                    for table_name, path in table_paths.items()
+                ]
+                pending = len(futures)
+                created = set()
+                try:
+                    while pending:
+                        table_name, batch = batches.get()
+                        if batch is None:
+                            pending -= 1
+                        else:
+                            self._write_batch(table_name, batch, created)
+                    self.conn.commit()
+                except BaseException:
+                    cancelled.set()
+                    # Drain so readers blocked on a full queue can exit
+                    while pending:
+                        if batches.get()[1] is None:
+                            pending -= 1
+                    raise
 
-            print(f"DEBUG: Loading file {path} into table '{table_name}'")
-            df.to_sql(table_name, self.conn, index=False, if_exists='replace')
+            # Re-raise any parsing error from the readers
+            for future in futures:
+                future.result()
         
         # Verify loaded tables
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print(f"DEBUG: Tables in SQLite: {tables}")
+        if logger.isEnabledFor(logging.DEBUG):
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            tables = [row["name"] for row in cursor.fetchall()]
+            logger.debug("Tables in SQLite: %s", tables)
+
+    async def _embed_query(self, user_query: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        embedding = _query_embedding_cache.get(user_query)
+        if embedding is None:
+            vector = np.asarray(await self.embeddings.aembed_query(user_query), dtype=np.float32)
+            embedding = vector / np.linalg.norm(vector)
+            _query_embedding_cache.set(user_query, embedding)
+        return embedding
+
+    def _cache_key(self, user_query: str) -> str:
+        # Both models are part of the key: the generated SQL depends on the filtered schema too
+        return LLMCache.cache_key(self.model_name, [self.filter_model_name, self._schema_hash, user_query])
+
+    async def _cached(
+        self, cache: LLMCache, user_query: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Returns the cached response for (model, schema, query), calling the LLM on a miss."""
+        key = self._cache_key(user_query)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        embedding = await self._embed_query(user_query)
+        if embedding is not None:
+            cached = cache.get_similar(self._cache_namespace, embedding)
+            if cached is not None:
+                return cached
 
-    def filter_schema(self, user_query: str) -> Dict:
+        result = await compute()
+        cache.set(key, result)
+        if embedding is not None:
+            cache.add_embedding(self._cache_namespace, embedding, key)
+        return result
+
+    async def filter_schema(self, user_query: str) -> Dict:
         """Step 1: LLM filters the schema to only required tables/columns."""
+        return await self._cached(
+            self._schema_cache, user_query, lambda: self._filter_schema(user_query)
+        )
+
+    async def _filter_schema(self, user_query: str) -> Dict:
         system_prompt = """You are a strictly logical Data Architect.
         Given a user query and a database schema, return a JSON object containing ONLY 
         the tables and columns strictly required to generate a SQL query for the answer.
@@ -99,16 +544,28 @@ class SmartDataAgent:
         }}
         """
         
+        # Static instructions + schema form the cacheable prefix; only the query varies
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("user", "Schema: {schema}\n\nQuery: {query}")
+            ("system", system_prompt + "\n\nSchema: {schema}"),
+            ("user", "Query: {query}")
         ])
         
-        chain = prompt | self.llm | JsonOutputParser()
-        return chain.invoke({"schema": json.dumps(self.schema), "query": user_query})
+        chain = prompt | self.filter_llm | JsonOutputParser()
+        return await chain.ainvoke({"schema": self._schema_str, "query": user_query})
 
-    def generate_sql(self, user_query: str, filtered_schema: Dict) -> str:
+    async def generate_sql(self, user_query: str, filtered_schema: Dict) -> str:
         """Step 2: Generate SQL using only the filtered schema."""
+        # The filtered schema is derived from (schema, query), so it is covered by the cache key
+        return await self._cached(
+            self._sql_cache, user_query, lambda: self._generate_sql(user_query, filtered_schema)
+        )
+
+    async def _generate_sql(self, user_query: str, filtered_schema: Dict) -> str:
+        chain = self._sql_prompt() | self.llm | StrOutputParser()
+        sql_query = await chain.ainvoke({"filtered_schema": _dump_filtered_schema(filtered_schema), "query": user_query})
+        return self._clean_sql(sql_query)
+
+    def _sql_prompt(self) -> ChatPromptTemplate:
         system_prompt = """You are an expert SQL Developer.
         Generate a SQL query to answer the user's question. 
         USE ONLY the tables and columns provided in the schema below.
@@ -122,70 +579,139 @@ class SmartDataAgent:
         5. If you cannot answer the question using the schema, return the string "NO_SQL_POSSIBLE" and nothing else.
         """
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("user", "Filtered Schema: {filtered_schema}\n\nQuestion: {query}")
+        return ChatPromptTemplate.from_messages([
+            ("system", system_prompt + "\n\nFiltered Schema: {filtered_schema}"),
+            ("user", "Question: {query}")
         ])
+
+    @staticmethod
+    def _clean_sql(sql_query: str) -> str:
+        # Basic cleanup - strips any markdown fence (```sql, ```sqlite, bare ```) in one pass
+        return _FENCE_RE.sub("", sql_query).strip()
+
+    def _run_query(self, sql: str):
+        """Executes SQL and returns (columns, rows). Blocking - call via asyncio.to_thread."""
+        key = sql.strip()
+        with self._query_lock:
+            # Looked up under the lock - the LRU's OrderedDict isn't safe to mutate from several threads
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                return cached
+
+            # Abort runaway queries (e.g. an accidental CROSS JOIN) - SQLite raises OperationalError("interrupted")
+            deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+            self.conn.set_progress_handler(
+                lambda: 1 if time.monotonic() > deadline else 0, SQLITE_PROGRESS_STEPS
+            )
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(sql)
+                if cursor.description:
+                    columns = [description[0] for description in cursor.description]
+                    results = cursor.fetchall()
+                else:
+                    columns, results = [], []
+            finally:
+                self.conn.set_progress_handler(None, 0)
+
+            if len(results) <= RESULT_CACHE_MAX_ROWS:
+                self._result_cache.set(key, (columns, results))
+
+        return columns, results
+
+    @staticmethod
+    def _query_too_expensive(sql: str) -> Dict:
+        return {
+            "answer": f"The generated query was too expensive to run within {QUERY_TIMEOUT_SECONDS:g} seconds. Please try a more specific question.",
+            "sql": sql,
+            "data": []
+        }
+
+    async def _answer_from_sql(self, sql: str, include_data: bool = True) -> Dict:
+        """Step 3: Execute the generated SQL and format the answer."""
+        if "NO_SQL_POSSIBLE" in sql:
+             return {
+                "answer": "I apologize, but I could not generate a valid SQL query to answer your question based on the provided schema/data. The question might clearly require information not present in the tables.",
+                "sql": sql,
+                "data": []
+             }
         
-        chain = prompt | self.llm | StrOutputParser()
-        sql_query = chain.invoke({"filtered_schema": json.dumps(filtered_schema), "query": user_query})
+        # Only the execution step needs the data, so the load is awaited as late as possible
+        await self.wait_until_loaded()
+        try:
+            columns, results = await asyncio.wait_for(
+                asyncio.to_thread(self._run_query, sql), timeout=QUERY_TIMEOUT_SECONDS * 2
+            )
+        except sqlite3.OperationalError as e:
+            if "interrupted" not in str(e):
+                raise
+            return self._query_too_expensive(sql)
+        except asyncio.TimeoutError:
+            # Waiting on the lock behind other queries, or stuck outside the VM
+            return self._query_too_expensive(sql)
         
-        # Basic cleanup
-        return sql_query.replace("```sql", "").replace("```", "").strip()
+        # Format results as text table (rendered by pandas rather than per-row string joins)
+        text_table = ""
+        if results:
+            text_table = pd.DataFrame.from_records(results, columns=columns).to_string(index=False)
+
+        # The list of dicts is only needed when the caller serializes the rows as JSON
+        data_result = [dict(row) for row in results] if include_data else []
+
+        return {
+            "answer": f"Executed SQL: `{sql}`\n\n{text_table}",
+            "sql": sql,
+            "data": data_result
+        }
 
-    def execute_and_answer(self, user_query: str):
+    async def execute_and_answer(self, user_query: str, include_data: bool = True):
         try:
             # 1. Filter Schema
-            print(f"DEBUG: User Query: '{user_query}'")
-            print(f"DEBUG: Loaded Schema Keys: {list(self.schema.keys()) if self.schema else 'None'}")
-            filtered_schema = self.filter_schema(user_query)
-            print(f"DEBUG: Filtered Schema: {json.dumps(filtered_schema, indent=2)}")
+            logger.debug("User Query: '%s'", user_query)
+            logger.debug("Loaded Schema Keys: %s", list(self.schema.keys()) if self.schema else None)
+            filtered_schema = await self.filter_schema(user_query)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Filtered Schema: %s", json.dumps(filtered_schema, indent=2))
             
             # 2. Generate SQL
-            sql = self.generate_sql(user_query, filtered_schema)
-            print(f"DEBUG: Generated SQL: {sql}")
-
-            if "NO_SQL_POSSIBLE" in sql:
-                 return {
-                    "answer": "I apologize, but I could not generate a valid SQL query to answer your question based on the provided schema/data. The question might clearly require information not present in the tables.",
-                    "sql": sql,
-                    "data": []
-                 }
-            
+            sql = await self.generate_sql(user_query, filtered_schema)
+            logger.debug("Generated SQL: %s", sql)
+
             # 3. Execute
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            if cursor.description:
-                columns = [description[0] for description in cursor.description]
-                results = cursor.fetchall()
-                data_result = [dict(zip(columns, row)) for row in results]
-            else:
-                data_result = []
-                results = []
-            
-            # Format results as text table
-            text_table = ""
-            if data_result:
-                # Create header
-                headers = list(data_result[0].keys())
-                
-                # Simple text representation
-                lines = []
-                lines.append(" | ".join(headers))
-                lines.append("-" * (sum(len(h) for h in headers) + 3 * (len(headers) - 1)))
-                
-                for row in data_result:
-                    lines.append(" | ".join(str(val) for val in row.values()))
-                
-                text_table = "\n".join(lines)
-
-            return {
-                "answer": f"Executed SQL: `{sql}`\n\n{text_table}",
-                "sql": sql,
-                "data": data_result
-            }
+            return await self._answer_from_sql(sql, include_data)
         except Exception as e:
             return f"Error executing SQL or processing request: {e}"
 
-def create_smart_agent(file_paths, schema_path, model="gpt-4o"):
-    return SmartDataAgent(file_paths, schema_path, model)
+    async def execute_and_answer_stream(self, user_query: str) -> AsyncIterator[str]:
+        """
+        Streaming variant of execute_and_answer, yielding server-sent events.
+
+        Emits `token` events with SQL deltas while the query is generated, then a
+        single `answer` event with the final result, or an `error` event.
+        """
+        def event(payload: Dict) -> str:
+            return f"data: {json.dumps(payload, default=str)}\n\n"
+
+        try:
+            filtered_schema = await self.filter_schema(user_query)
+
+            key = self._cache_key(user_query)
+            sql = self._sql_cache.get(key)
+            if sql is not None:
+                yield event({"type": "token", "content": sql})
+            else:
+                chain = self._sql_prompt() | self.llm
+                chunks = []
+                async for chunk in chain.astream({"filtered_schema": _dump_filtered_schema(filtered_schema), "query": user_query}):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield event({"type": "token", "content": chunk.content})
+                sql = self._clean_sql("".join(chunks))
+                self._sql_cache.set(key, sql)
+
+            yield event({"type": "answer", **await self._answer_from_sql(sql)})
+        except Exception as e:
+            yield event({"type": "error", "content": f"Error executing SQL or processing request: {e}"})
+
+def create_smart_agent(file_paths, schema_path, model="gpt-4o", semantic_cache=False, filter_model="gpt-4o-mini"):
+    return SmartDataAgent(file_paths, schema_path, model, semantic_cache, filter_model)
@@ -48,5 +48,8 @@ appConfig = {
     "redis_url": os.getenv("REDIS_URL"),
     "openai_api_key": os.getenv("OPENAI_API_KEY"),
     "scrapingbee_api_key": os.getenv("SCRAPINGBEE_API_KEY"),
-    "tavily_api_key": os.getenv("TAVILY_API_KEY")
+    "tavily_api_key": os.getenv("TAVILY_API_KEY"),
+    # Optional settings
+    "debug": os.getenv("DEBUG", "false").lower() in ("1", "true", "yes"),
+    "agent_sample_rows": int(os.getenv("AGENT_SAMPLE_ROWS")) if os.getenv("AGENT_SAMPLE_ROWS") else None,
 }
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
-from src.services.supabase import supabase
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from src.services.supabase import async_supabase
 from src.services.clerkAuth import get_current_user_clerk_id
 from src.models.index import ChatCreate
 
 
 router = APIRouter(tags=["chatRoutes"])
 
+# Debug trace - handlers and level (DEBUG env var) are configured once in src/server.py
+logger = logging.getLogger(__name__)
+
+# Max messages returned per get_chat call
+MESSAGES_PAGE_SIZE = 200
+
 """
 `/api/chats`
     - POST `/api/chats/` ~ Create a new chat
     - DELETE `/api/chats/{chat_id}` ~ Delete a specific chat
-    - GET `/api/chats/{chat_id}` ~ Get a specific chat
+    - GET `/api/chats/{chat_id}` ~ Get a specific chat (latest messages first page, older pages via `limit` / `before`)
 
 """
 
@@ -19,7 +27,6 @@ router = APIRouter(tags=["chatRoutes"])
 async def create_chat(
     chat: ChatCreate, current_user_clerk_id: str = Depends(get_current_user_clerk_id)
 ):
-    print("DEBUG: Entered create_chat")
     """
     ! Logic Flow
     * 1. Get current user clerk_id
@@ -27,6 +34,7 @@ async def create_chat(
     * 3. Check if chat creation failed, then return error
     * 4. Return successfully created chat data
     """
+    logger.debug("Entered create_chat")
     try:
         chat_insert_data = {
             "title": chat.title,
@@ -34,7 +42,7 @@ async def create_chat(
             "clerk_id": current_user_clerk_id,
         }
         chat_creation_result = (
-            supabase.table("chats").insert(chat_insert_data).execute()
+            await async_supabase.table("chats").insert(chat_insert_data).execute()
         )
 
         if not chat_creation_result.data:
@@ -70,7 +78,7 @@ async def delete_chat(
     """
     try:
         chat_deletion_result = (
-            supabase.table("chats")
+            await async_supabase.table("chats")
             .delete()
             .eq("id", chat_id)
             .eq("clerk_id", current_user_clerk_id)
@@ -99,58 +107,67 @@ async def delete_chat(
 
 @router.get("/{chat_id}")
 async def get_chat(
-    chat_id: str, current_user_clerk_id: str = Depends(get_current_user_clerk_id)
+    chat_id: str,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_PAGE_SIZE),
+    before: Optional[str] = None,
+    current_user_clerk_id: str = Depends(get_current_user_clerk_id),
 ):
-    print(f"DEBUG: Entered get_chat for {chat_id}")
-    with open("debug_log.txt", "a") as f:
-        f.write(f"DEBUG: Entered get_chat for {chat_id}\n")
     """
     ! Logic Flow:
     * 1. Get current user clerk_id
-    * 2. Verify if the chat exists and belongs to the current user
-    * 3. Get chat messages
-    * 4. Return chat data
+    * 2. Verify if the chat exists and belongs to the current user, fetching the newest page of its messages in the same query
+    * 3. Return chat data (page in chronological order) and the cursor ("created_at|id" of the oldest message) for the previous page, if any
     """
+    logger.debug("Entered get_chat for %s", chat_id)
     try:
-        # Verify if the chat exists and belongs to the current user
-        chat_ownership_verification_result = (
-            supabase.table("chats")
-            .select("*")
+        # Verify ownership and fetch the messages in one request (PostgREST embedded resource)
+        chat_query = (
+            async_supabase.table("chats")
+            .select("*, messages(*)")
             .eq("id", chat_id)
             .eq("clerk_id", current_user_clerk_id)
-            .execute()
+            .order("created_at", desc=True, foreign_table="messages")
+            .order("id", desc=True, foreign_table="messages")
+            .limit(limit, foreign_table="messages")
         )
 
-        print(f"DEBUG: Requesting chat_id: {chat_id}")
-        print(f"DEBUG: Current user clerk_id: {current_user_clerk_id}")
-        if chat_ownership_verification_result.data:
-             with open("debug_log.txt", "a") as f:
-                 f.write(f"DEBUG: Chat FOUND for user {current_user_clerk_id}\n")
-        else:
-             with open("debug_log.txt", "a") as f:
-                 f.write(f"DEBUG: Chat NOT FOUND for user {current_user_clerk_id}. ChatId: {chat_id}\n")
+        # Keyset pagination on (created_at, id): continue before the oldest message of the previous page,
+        # with id breaking ties between messages sharing a timestamp
+        if before:
+            before_created_at, _, before_id = before.rpartition("|")
+            if not before_created_at or not before_id:
+                raise HTTPException(status_code=400, detail="Invalid 'before' cursor")
+            chat_query = chat_query.or_(
+                f'created_at.lt."{before_created_at}",'
+                f'and(created_at.eq."{before_created_at}",id.lt.{before_id})',
+                reference_table="messages",
+            )
+
+        chat_query_result = await chat_query.maybe_single().execute()
 
-        if not chat_ownership_verification_result.data:
+        if not chat_query_result or not chat_query_result.data:
+            logger.debug("Chat NOT FOUND for user %s. ChatId: %s", current_user_clerk_id, chat_id)
             raise HTTPException(
                 status_code=404,
                 detail="Chat not found or you don't have permission to access it",
             )
 
-        chat_result = chat_ownership_verification_result.data[0]
+        logger.debug("Chat FOUND for user %s", current_user_clerk_id)
 
-        messages_result = (
-            supabase.table("messages")
-            .select("*")
-            .eq("chat_id", chat_id)
-            .order("created_at", desc=False)
-            .execute()
-        )
+        chat_result = chat_query_result.data
+        # Fetched newest first - return the page oldest first for display
+        messages = list(reversed(chat_result.get("messages") or []))
+        chat_result["messages"] = messages
 
-        chat_result["messages"] = messages_result.data or []
+        # A full page means there may be older messages
+        next_cursor = (
+            f"{messages[0]['created_at']}|{messages[0]['id']}" if len(messages) == limit else None
+        )
 
         return {
             "message": "Chat retrieved successfully",
             "data": chat_result,
+            "next_cursor": next_cursor,
         }
 
     except HTTPException as e:
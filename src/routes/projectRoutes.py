@@ -1,11 +1,23 @@
-from typing import Dict, List
-import time
+import asyncio
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
 from fastapi import APIRouter, HTTPException, Depends
-from src.agents.simple_agent.agent import create_simple_rag_agent
-from src.agents.supervisor_agent.agent import create_supervisor_agent
+from fastapi.responses import StreamingResponse
 import httpx
 
-from src.services.supabase import supabase
+from src.services.supabase import async_supabase
+from src.services.redisCache import (
+    PROJECT_SETTINGS_CACHE_KEY,
+    PROJECT_SETTINGS_CACHE_TTL,
+    PROJECTS_CACHE_KEY,
+    PROJECTS_CACHE_TTL,
+    get_cached_response,
+    invalidate_cache,
+    set_cached_response,
+)
 from src.services.clerkAuth import get_current_user_clerk_id
 from src.models.index import ProjectCreate, ProjectSettings
 from src.models.index import MessageCreate, MessageRole
@@ -13,9 +25,39 @@ import os
 import shutil
 from src.services.awsS3 import s3_client
 from src.config.index import appConfig
-from src.agents.csv_agent import create_project_csv_agent
 
 router = APIRouter(tags=["projectRoutes"])
+
+# Column projections - only fetch what the handlers return or branch on
+PROJECT_COLUMNS = "id,name,description,created_at"
+CHAT_COLUMNS = "id,title,created_at,project_id"
+PROJECT_SETTINGS_COLUMNS = ",".join(["id", "project_id", *ProjectSettings.model_fields])
+PROJECT_DOCUMENT_COLUMNS = "id,filename,s3_key,processing_status"
+
+# Number of previous messages passed to the agents as context
+CHAT_HISTORY_LIMIT = 10
+
+# Phrases marking a RAG answer as a generic "I don't know" - matched case-insensitively in one pass
+GENERIC_RAG_PHRASES = [
+    "project documents do not contain",
+    "i searched available resources but found no",
+    "information not present",
+    "to find this information, you would typically",
+    "you would typically need to query",
+    "no relevant chunks found",
+    "analysis from structured data",
+    "executed sql",
+]
+GENERIC_RAG_RESPONSE_RE = re.compile(
+    "|".join(map(re.escape, GENERIC_RAG_PHRASES)), re.IGNORECASE
+)
+
+# Smart SQL Agents reused across messages: project_id -> (files fingerprint, agent), least recently used first
+SMART_AGENT_CACHE_SIZE = 32
+smart_agent_cache: "OrderedDict[str, Tuple[str, object]]" = OrderedDict()
+
+# AI responses still being generated and saved - referenced so they aren't garbage collected mid-run
+response_tasks: Set[asyncio.Task] = set()
 """
 `/api/projects`
 
@@ -28,36 +70,49 @@ router = APIRouter(tags=["projectRoutes"])
   - GET `/api/projects/{project_id}/settings` ~ Get specific project settings
   
   - PUT `/api/projects/{project_id}/settings` ~ Update specific project settings
-  - POST `/api/projects/{project_id}/chats/{chat_id}/messages` ~ Send a message to a Specific Chat
+  - POST `/api/projects/{project_id}/chats/{chat_id}/messages` ~ Send a message to a Specific Chat (streams the AI response as server-sent events)
   
 """
 
+def embedded_one(embedded):
+    """
+    Normalizes a to-one embedded resource. PostgREST returns an object (or null) when the
+    foreign key is unique, and a list otherwise.
+    """
+    if isinstance(embedded, list):
+        return embedded[0] if embedded else None
+    return embedded
+
+
 @router.get("/")
 async def get_projects(current_user_clerk_id: str = Depends(get_current_user_clerk_id)):
     """
     ! Logic Flow
     * 1. Get current user clerk_id
-    * 2. Query projects table for projects related to the current user
-    * 3. Return projects data
+    * 2. Return the cached project list if present (Redis, invalidated on create/delete)
+    * 3. Query projects table for projects related to the current user
+    * 4. Cache and return projects data
     """
-    start_time = time.time()
-    print(f"[Profiling] get_projects start: {start_time}")
-
     try:
+        projects_cache_key = PROJECTS_CACHE_KEY.format(current_user_clerk_id=current_user_clerk_id)
+        cached_projects = await get_cached_response(projects_cache_key)
+        if cached_projects is not None:
+            return cached_projects
+
         projects_query_result = (
-            supabase.table("projects")
-            .select("*")
+            await async_supabase.table("projects")
+            .select(PROJECT_COLUMNS)
             .eq("clerk_id", current_user_clerk_id)
             .execute()
         )
-        db_time = time.time()
-        print(f"[Profiling] Database query took: {db_time - start_time}s")
-
 
-        return {
+        projects_response = {
             "message": "Projects retrieved successfully",
             "data": projects_query_result.data or [],
         }
+        await set_cached_response(projects_cache_key, projects_response, PROJECTS_CACHE_TTL)
+
+        return projects_response
 
     except HTTPException as e:
         raise e
@@ -84,62 +139,38 @@ async def create_project(
     """
     ! Logic Flow
     * 1. Get current user clerk_id
-    * 2. Insert new project into database
+    * 2. Insert new project and its default settings into database (single transaction)
     * 3. Check if project creation failed, then return error
-    * 4. Create default project settings for the new project
-    * 5. Check if project settings creation failed, then rollback the project creation
-    * 6. Return newly created project data
+    * 4. Invalidate the cached project list of the current user
+    * 5. Return newly created project data
     """
     try:
-        # Insert new project into database
-        project_insert_data = {
-            "name": project_data.name,
-            "description": project_data.description,
-            "clerk_id": current_user_clerk_id,
-        }
-
+        # Insert the project and its default settings in one transaction (see create_project_with_defaults migration)
         project_creation_result = (
-            supabase.table("projects").insert(project_insert_data).execute()
+            await async_supabase.rpc(
+                "create_project_with_defaults",
+                {
+                    "p_name": project_data.name,
+                    "p_description": project_data.description,
+                    "p_clerk_id": current_user_clerk_id,
+                },
+            ).execute()
         )
 
-        if not project_creation_result.data:
+        newly_created_project = project_creation_result.data
+        if isinstance(newly_created_project, list):
+            newly_created_project = newly_created_project[0] if newly_created_project else None
+
+        if not newly_created_project:
             raise HTTPException(
                 status_code=422,
                 detail="Failed to create project - invalid data provided",
             )
 
-        newly_created_project = project_creation_result.data[0]
-
-        # Create default project settings for the new project
-        project_settings_data = {
-            "project_id": newly_created_project["id"],
-            "embedding_model": "text-embedding-3-large",
-            "rag_strategy": "basic",
-            "agent_type": "agentic",
-            "chunks_per_search": 10,
-            "final_context_size": 5,
-            "similarity_threshold": 0.3,
-            "number_of_queries": 5,
-            "reranking_enabled": True,
-            "reranking_model": "reranker-english-v3.0",
-            "vector_weight": 0.7,
-            "keyword_weight": 0.3,
-        }
-
-        project_settings_creation_result = (
-            supabase.table("project_settings").insert(project_settings_data).execute()
+        await invalidate_cache(
+            PROJECTS_CACHE_KEY.format(current_user_clerk_id=current_user_clerk_id)
         )
 
-        if not project_settings_creation_result.data:
-            # Rollback: Delete the project if settings creation fails
-            supabase.table("projects").delete().eq(
-                "id", newly_created_project["id"]
-            ).execute()
-            raise HTTPException(
-                status_code=422,
-                detail="Failed to create project settings - project creation rolled back",
-            )
-
         return {
             "message": "Project created successfully",
             "data": newly_created_project,
@@ -165,19 +196,21 @@ async def delete_project(
     * 2. Verify if the project exists and belongs to the current user
     * 3. Delete project - CASCADE will automatically delete all related data:
     * 4. Check if project deletion failed, then return error
-    * 5. Return successfully deleted project data
+    * 5. Invalidate the cached project list and project settings
+    * 6. Return successfully deleted project data
     """
     try:
         # Verify if the project exists and belongs to the current user
         project_ownership_verification_result = (
-            supabase.table("projects")
+            await async_supabase.table("projects")
             .select("id")
             .eq("id", project_id)
             .eq("clerk_id", current_user_clerk_id)
+            .maybe_single()
             .execute()
         )
 
-        if not project_ownership_verification_result.data:
+        if not project_ownership_verification_result or not project_ownership_verification_result.data:
             raise HTTPException(
                 status_code=404,  # Not Found - project doesn't exist or doesn't belong to user
                 detail="Project not found or you don't have permission to delete it",
@@ -185,7 +218,7 @@ async def delete_project(
 
         # Delete project ~ "CASCADE" will automatically delete all related data: project_settings, project_documents, document_chunks, chats, messages, etc.
         project_deletion_result = (
-            supabase.table("projects")
+            await async_supabase.table("projects")
             .delete()
             .eq("id", project_id)
             .eq("clerk_id", current_user_clerk_id)
@@ -200,6 +233,15 @@ async def delete_project(
 
         successfully_deleted_project = project_deletion_result.data[0]
 
+        await invalidate_cache(
+            PROJECTS_CACHE_KEY.format(current_user_clerk_id=current_user_clerk_id)
+        )
+        await invalidate_cache(
+            PROJECT_SETTINGS_CACHE_KEY.format(
+                project_id=project_id, current_user_clerk_id=current_user_clerk_id
+            )
+        )
+
         return {
             "message": "Project deleted successfully",
             "data": successfully_deleted_project,
@@ -227,14 +269,15 @@ async def get_project(
     """
     try:
         project_result = (
-            supabase.table("projects")
-            .select("*")
+            await async_supabase.table("projects")
+            .select(PROJECT_COLUMNS)
             .eq("id", project_id)
             .eq("clerk_id", current_user_clerk_id)
+            .maybe_single()
             .execute()
         )
 
-        if not project_result.data:
+        if not project_result or not project_result.data:
             raise HTTPException(
                 status_code=404,
                 detail="Project not found or you don't have permission to access it",
@@ -242,7 +285,7 @@ async def get_project(
 
         return {
             "message": "Project retrieved successfully",
-            "data": project_result.data[0],
+            "data": project_result.data,
         }
 
     except HTTPException as e:
@@ -267,8 +310,8 @@ async def get_project_chats(
     """
     try:
         project_chats_result = (
-            supabase.table("chats")
-            .select("*")
+            await async_supabase.table("chats")
+            .select(CHAT_COLUMNS)
             .eq("project_id", project_id)
             .eq("clerk_id", current_user_clerk_id)
             .order("created_at", desc=True)
@@ -300,28 +343,51 @@ async def get_project_settings(
     """
     ! Logic Flow
     * 1. Get current user clerk_id
-    * 2. Verify if the project exists and belongs to the current user
-    * 3. Check if the project settings exists for the project
-    * 4. Return project settings data
+    * 2. Return the cached project settings if present (Redis, invalidated on update)
+    * 3. Verify if the project exists and belongs to the current user, fetching its settings in the same query
+    * 4. Check if the project settings exists for the project
+    * 5. Cache and return project settings data
     """
     try:
+        settings_cache_key = PROJECT_SETTINGS_CACHE_KEY.format(
+            project_id=project_id, current_user_clerk_id=current_user_clerk_id
+        )
+        cached_project_settings = await get_cached_response(settings_cache_key)
+        if cached_project_settings is not None:
+            return cached_project_settings
+
+        # Ownership verification + settings in a single request (PostgREST embedded resource)
         project_settings_result = (
-            supabase.table("project_settings")
-            .select("*")
-            .eq("project_id", project_id)
+            await async_supabase.table("projects")
+            .select(f"id, project_settings({PROJECT_SETTINGS_COLUMNS})")
+            .eq("id", project_id)
+            .eq("clerk_id", current_user_clerk_id)
+            .maybe_single()
             .execute()
         )
 
-        if not project_settings_result.data:
+        if not project_settings_result or not project_settings_result.data:
             raise HTTPException(
                 status_code=404,
-                detail="Project settings not found or you don't have permission to access it",
+                detail="Project not found or you don't have permission to access it",
             )
 
-        return {
+        project_settings = embedded_one(project_settings_result.data.get("project_settings"))
+        if not project_settings:
+            raise HTTPException(
+                status_code=404,
+                detail="Project settings not found for this project",
+            )
+
+        project_settings_response = {
             "message": "Project settings retrieved successfully",
-            "data": project_settings_result.data[0],
+            "data": project_settings,
         }
+        await set_cached_response(
+            settings_cache_key, project_settings_response, PROJECT_SETTINGS_CACHE_TTL
+        )
+
+        return project_settings_response
 
     except HTTPException as e:
         raise e
@@ -342,35 +408,29 @@ async def update_project_settings(
     """
     ! Logic Flow
     * 1. Get current user clerk_id
-    * 2. Verify if the project exists and belongs to the current user
-    * 3. Verify if the project settings exist for the project
-    * 4. Update project settings
-    * 5. Check if project settings update failed, then return error
-    * 6. Return successfully updated project settings data
+    * 2. Verify if the project exists, belongs to the current user and has settings (single query)
+    * 3. Update project settings
+    * 4. Check if project settings update failed, then return error
+    * 5. Return successfully updated project settings data
     """
     try:
+        # Verify project ownership and settings existence in a single request
         project_ownership_verification_result = (
-            supabase.table("projects")
-            .select("id")
+            await async_supabase.table("projects")
+            .select("id, project_settings(id)")
             .eq("id", project_id)
             .eq("clerk_id", current_user_clerk_id)
+            .maybe_single()
             .execute()
         )
 
-        if not project_ownership_verification_result.data:
+        if not project_ownership_verification_result or not project_ownership_verification_result.data:
             raise HTTPException(
                 status_code=404,
                 detail="Project not found or you don't have permission to update its settings",
             )
 
-        project_settings_ownership_verification_result = (
-            supabase.table("project_settings")
-            .select("id")
-            .eq("project_id", project_id)
-            .execute()
-        )
-
-        if not project_settings_ownership_verification_result.data:
+        if not embedded_one(project_ownership_verification_result.data.get("project_settings")):
             raise HTTPException(
                 status_code=404,
                 detail="Project settings not found for this project",
@@ -380,7 +440,7 @@ async def update_project_settings(
             settings.model_dump()  # Pydantic modal to dictionary conversion
         )
         project_settings_update_result = (
-            supabase.table("project_settings")
+            await async_supabase.table("project_settings")
             .update(project_settings_update_data)
             .eq("project_id", project_id)
             .execute()
@@ -391,6 +451,12 @@ async def update_project_settings(
                 status_code=422, detail="Failed to update project settings"
             )
 
+        await invalidate_cache(
+            PROJECT_SETTINGS_CACHE_KEY.format(
+                project_id=project_id, current_user_clerk_id=current_user_clerk_id
+            )
+        )
+
         return {
             "message": "Project settings updated successfully",
             "data": project_settings_update_result.data[0],
@@ -405,53 +471,218 @@ async def update_project_settings(
             detail=f"An internal server error occurred while updating project {project_id} settings: {str(e)}",
         )
 
-def get_chat_history(chat_id: str, exclude_message_id: str = None) -> List[Dict[str, str]]:
+
+def download_project_file(s3_key: str, local_path: str) -> str:
+    """
+    Download a project file from S3 unless the local copy is already current (blocking - run in a thread).
+
+    The S3 ETag of the downloaded object is kept in a `<local_path>.etag` sidecar file, so unchanged
+    files are not transferred again on every message.
+
+    Returns:
+        The ETag of the S3 object
     """
-    Fetch and format chat history for agent context.
-    
-    Retrieves the last 10 messages (5 user + 5 assistant) from the chat,
-    excluding the current message being processed.
-    
+    etag_path = local_path + ".etag"
+    etag = s3_client.head_object(Bucket=appConfig["s3_bucket_name"], Key=s3_key)["ETag"]
+
+    if os.path.exists(local_path) and os.path.exists(etag_path):
+        with open(etag_path) as f:
+            if f.read() == etag:
+                return etag
+
+    s3_client.download_file(appConfig["s3_bucket_name"], s3_key, local_path)
+    with open(etag_path, "w") as f:
+        f.write(etag)
+
+    return etag
+
+
+async def prepare_smart_agent(project_id: str, schema_files: List[Dict], structured_files: List[Dict]):
+    """
+    Download the project's structured files and JSON schema, and build (or reuse) a Smart SQL Agent.
+
     Args:
-        chat_id: The ID of the chat
-        exclude_message_id: Optional message ID to exclude from history
-        
+        project_id: The ID of the project
+        schema_files: The project's JSON schema documents (the first one is used)
+        structured_files: The CSV/Excel documents to load
+
     Returns:
-        List of message dictionaries with 'role' and 'content' keys
+        A SmartDataAgent, or None if no JSON schema file could be found/downloaded
+    """
+    # We need both structured files AND a schema definition to run the smart agent
+    if not schema_files:
+        return None
+    schema_doc = schema_files[0]
+
+    schema_dir = f"/tmp/schema_agent/{project_id}"
+    os.makedirs(schema_dir, exist_ok=True)
+    schema_path = os.path.join(schema_dir, schema_doc["filename"])
+
+    # Create temp dir for this project's CSVs
+    temp_dir = f"/tmp/csv_agent/{project_id}"
+    os.makedirs(temp_dir, exist_ok=True)
+    local_csv_paths = [os.path.join(temp_dir, doc["filename"]) for doc in structured_files]
+
+    # Download schema and files concurrently (skipped for files whose S3 ETag matches the local copy)
+    schema_download, *file_downloads = await asyncio.gather(
+        asyncio.to_thread(download_project_file, schema_doc["s3_key"], schema_path),
+        *[
+            asyncio.to_thread(download_project_file, doc["s3_key"], local_path)
+            for doc, local_path in zip(structured_files, local_csv_paths)
+        ],
+        return_exceptions=True,
+    )
+
+    if isinstance(schema_download, Exception):
+        print(f"Failed to download schema: {schema_download}")
+        return None
+
+    for file_download in file_downloads:
+        if isinstance(file_download, Exception):
+            raise file_download
+
+    # Reuse the project's agent while the schema and files are unchanged (same S3 keys and ETags)
+    # and its data load hasn't failed - a failed/cancelled load is replaced by a fresh agent
+    files_fingerprint = hashlib.sha256(
+        "\n".join(
+            sorted(
+                f"{doc['s3_key']}:{etag}"
+                for doc, etag in zip([schema_doc, *structured_files], [schema_download, *file_downloads])
+            )
+        ).encode()
+    ).hexdigest()
+
+    cached_agent = smart_agent_cache.get(project_id)
+    if cached_agent and cached_agent[0] == files_fingerprint and not cached_agent[1].load_failed:
+        smart_agent_cache.move_to_end(project_id)
+        return cached_agent[1]
+
+    from src.agents.smart_sql_agent import create_smart_agent
+
+    agent = create_smart_agent(local_csv_paths, schema_path)
+
+    smart_agent_cache[project_id] = (files_fingerprint, agent)
+    smart_agent_cache.move_to_end(project_id)
+    if len(smart_agent_cache) > SMART_AGENT_CACHE_SIZE:
+        smart_agent_cache.popitem(last=False)
+
+    return agent
+
+
+async def answer_from_structured_files(
+    project_id: str, schema_files: List[Dict], structured_files: List[Dict], user_query: str
+) -> str:
+    """
+    Answer the query from the project's structured files with the Smart SQL Agent.
+    Failures are returned as a notice in the answer text rather than raised.
+    """
+    try:
+        agent = await prepare_smart_agent(project_id, schema_files, structured_files)
+        if not agent:
+            return "[Notice: Structured files found but no JSON schema file was detected. Please upload a .json schema file to process the data.]"
+
+        result = await agent.execute_and_answer(user_query, include_data=False)
+        if isinstance(result, dict):
+            return result.get("answer", "No answer generated.")
+        return str(result)
+
+    except Exception as e:
+        print(f"Smart SQL Agent failed: {e}")
+        return f"[Error analyzing structured data: {str(e)}]"
+
+
+def is_answer_token(token, metadata: Dict) -> bool:
+    """
+    Whether a streamed LLM chunk is part of the agent's answer.
+
+    Only the top-level agent's model node writes the answer. The guardrail check, query
+    rewriting and sub-agents (which run inside the agent's "tools" node) also call LLMs,
+    but their output is not streamed to the client.
+    """
+    return (
+        getattr(token, "type", None) == "AIMessageChunk"
+        and isinstance(token.content, str)
+        and bool(token.content)
+        and metadata.get("langgraph_node") == "model"
+        and "tools:" not in metadata.get("langgraph_checkpoint_ns", "")
+    )
+
+
+def sse_event(payload: Dict) -> str:
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+
+@router.post("/{project_id}/query/stream")
+async def stream_structured_query(
+    project_id: str,
+    message: MessageCreate,
+    current_user_clerk_id: str = Depends(get_current_user_clerk_id),
+):
+    """
+    ! Logic Flow
+    * 1. Get current user clerk_id
+    * 2. Verify if the project exists and belongs to the current user
+    * 3. Get the project's completed structured files (CSV/Excel) and JSON schema files (concurrently with step 2)
+    * 4. Build the Smart SQL Agent from the structured files and JSON schema
+    * 5. Stream the generated SQL tokens and the final answer as server-sent events
     """
     try:
-        query = (
-            supabase.table("messages")
-            .select("id, role, content")
-            .eq("chat_id", chat_id)
-            .order("created_at", desc=False)
+        # Ownership, structured files (is_structured generated column) and schema files concurrently
+        project_ownership_verification_result, structured_files_result, schema_files_result = await asyncio.gather(
+            async_supabase.table("projects")
+            .select("id")
+            .eq("id", project_id)
+            .eq("clerk_id", current_user_clerk_id)
+            .maybe_single()
+            .execute(),
+            async_supabase.table("project_documents")
+            .select(PROJECT_DOCUMENT_COLUMNS)
+            .eq("project_id", project_id)
+            .eq("processing_status", "completed")
+            .eq("is_structured", True)
+            .execute(),
+            async_supabase.table("project_documents")
+            .select(PROJECT_DOCUMENT_COLUMNS)
+            .eq("project_id", project_id)
+            .eq("processing_status", "completed")
+            .ilike("filename", "%.json")
+            .execute(),
         )
-        
-        # Exclude current message if provided
-        if exclude_message_id:
-            query = query.neq("id", exclude_message_id)
-        
-        messages_result = query.execute()
-        
-        if not messages_result.data:
-            return []
-        
-        # Get last 10 messages (limit to 10 total messages)
-        recent_messages = messages_result.data[-10:]
-        
-        # Format messages for agent
-        formatted_history = []
-        for msg in recent_messages:
-            formatted_history.append({
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", "")
-            })
-        
-        return formatted_history
-    except Exception:
-        # If history retrieval fails, return empty list
-        return []
 
+        if not project_ownership_verification_result or not project_ownership_verification_result.data:
+            raise HTTPException(
+                status_code=404,
+                detail="Project not found or you don't have permission to access it",
+            )
+
+        structured_files = structured_files_result.data or []
+
+        if not structured_files:
+            raise HTTPException(
+                status_code=404,
+                detail="No processed structured files (CSV/Excel) found for this project",
+            )
+
+        agent = await prepare_smart_agent(project_id, schema_files_result.data or [], structured_files)
+        if not agent:
+            raise HTTPException(
+                status_code=422,
+                detail="Structured files found but no JSON schema file was detected. Please upload a .json schema file to process the data.",
+            )
+
+        return StreamingResponse(
+            agent.execute_and_answer_stream(message.content),
+            media_type="text/event-stream",
+        )
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"An internal server error occurred while querying project {project_id} data: {str(e)}",
+        )
 
 
 @router.post("/{project_id}/chats/{chat_id}/messages")
@@ -467,6 +698,10 @@ async def send_message(
     Step 3 : Pipeline A (Structured) - Invoke CSV Agent if CSV/Excel files exist.
     Step 4 : Pipeline B (Unstructured) - Invoke RAG Agent if other files exist or fallback.
     Step 5 : Combine responses and insert into database.
+
+    The response is a server-sent event stream: `token` events carry the RAG answer as it is
+    generated, followed by a single `message` event with the stored user and AI messages
+    (the AI message is the combined final answer), or an `error` event.
     """
     try:
         # Step 1 : Insert the message into the database.
@@ -478,178 +713,159 @@ async def send_message(
             "role": MessageRole.USER.value,
         }
         message_creation_result = (
-            supabase.table("messages").insert(message_insert_data).execute()
+            await async_supabase.table("messages").insert(message_insert_data).execute()
         )
         if not message_creation_result.data:
             raise HTTPException(status_code=422, detail="Failed to create message")
         
         current_message_id = message_creation_result.data[0]["id"]
-        
-        # Step 2 : Analyze available files to determine pipelines
-        project_docs_result = supabase.table("project_documents").select("*").eq("project_id", project_id).eq("processing_status", "completed").execute()
-        project_docs = project_docs_result.data or []
-        
-        structured_files = []
-        unstructured_files = []
-        
-        for doc in project_docs:
-            fname = doc.get("filename", "").lower()
-            if fname.endswith(('.csv', '.xlsx', '.xls')):
-                structured_files.append(doc)
-            else:
-                unstructured_files.append(doc)
-        
-        csv_response_text = ""
-        rag_response_text = ""
-        citations = [] # RAG only mostly
 
-        # Step 3 : Structured Pipeline (CSV Agent)
+        # Documents, settings and chat history (excluding the current message) in one round trip
+        # (see send_message_context migration)
+        send_message_context_result = await async_supabase.rpc(
+            "send_message_context",
+            {
+                "p_project_id": project_id,
+                "p_chat_id": chat_id,
+                "p_exclude": current_message_id,
+                "p_clerk_id": current_user_clerk_id,
+                "p_history_limit": CHAT_HISTORY_LIMIT,
+            },
+        ).execute()
+        send_message_context = send_message_context_result.data or {}
+
+        project_settings = send_message_context.get("settings") or {}
+        agent_type = project_settings.get("agent_type", "simple")
+        chat_history = send_message_context.get("history") or []
+
+        # Step 2 : Analyze available files to determine pipelines (partitioned by the database)
+        structured_files = send_message_context.get("structured") or []
+        unstructured_files = send_message_context.get("unstructured") or []
+        schema_files = send_message_context.get("schema") or []
+        
+        # Step 3 : Structured Pipeline (CSV Agent) - runs concurrently with the RAG stream below
+        structured_answer_task = None
         if structured_files:
-            # We need both structured files AND a schema definition to run the smart agent
-            schema_path = None
-            
-            # Check for schema file (any .json file) in project documents
-            for doc in project_docs:
-                if doc.get("filename", "").lower().endswith(".json"):
-                    s3_key = doc["s3_key"]
-                    fname = doc["filename"]
-                    temp_dir = f"/tmp/schema_agent/{project_id}"
-                    os.makedirs(temp_dir, exist_ok=True)
-                    local_path = os.path.join(temp_dir, fname)
-                    
-                    # Download schema
-                    try:
-                        s3_client.download_file(appConfig["s3_bucket_name"], s3_key, local_path)
-                        schema_path = local_path
-                    except Exception as e:
-                        print(f"Failed to download schema: {e}")
-                    break
-
-            if schema_path:
-                try:
-                    # Create temp dir for this project's CSVs
-                    temp_dir = f"/tmp/csv_agent/{project_id}"
-                    os.makedirs(temp_dir, exist_ok=True)
-                    
-                    local_csv_paths = []
-                    for doc in structured_files:
-                        s3_key = doc["s3_key"]
-                        fname = doc["filename"]
-                        local_path = os.path.join(temp_dir, fname)
-                        
-                        # Download file (overwrite or check existence - downloading ensures freshness)
-                        s3_client.download_file(appConfig["s3_bucket_name"], s3_key, local_path)
-                        local_csv_paths.append(local_path)
-                    
-                    # Invoke NEW Smart Agent
-                    from src.agents.smart_sql_agent import create_smart_agent
-                    
-                    agent = create_smart_agent(local_csv_paths, schema_path)
-                    result = agent.execute_and_answer(message_content)
-                    
-                    if isinstance(result, dict):
-                         csv_response_text = result.get("answer", "No answer generated.")
-                    else:
-                         csv_response_text = str(result)
-                    
-                except Exception as e:
-                    print(f"Smart SQL Agent failed: {e}")
-                    csv_response_text = f"[Error analyzing structured data: {str(e)}]"
-            else:
-                 csv_response_text = "[Notice: Structured files found but no JSON schema file was detected. Please upload a .json schema file to process the data.]"
+            structured_answer_task = asyncio.create_task(
+                answer_from_structured_files(project_id, schema_files, structured_files, message_content)
+            )
 
         # Step 4 : Unstructured Pipeline (RAG Agent / Web Search)
         # We run this pipeline to handle:
         # 1. Unstructured documents (PDFs, etc.)
         # 2. Web Search (if Agentic mode)
         # 3. General conversation
-        should_run_rag = True
-        
-        if should_run_rag:
-            # Step 2 (orig) : Get project settings
-            try:
-                project_settings = await get_project_settings(project_id)
-                agent_type = project_settings["data"].get("agent_type", "simple")
-            except Exception:
-                agent_type = "simple"
-                
-            # Step 3 (orig) : Get chat history
-            chat_history = get_chat_history(chat_id, exclude_message_id=current_message_id)
-            
-            agent = None
-            if agent_type == "simple":
-                agent = create_simple_rag_agent(
-                    project_id=project_id,
-                    model="gpt-4o",
-                    chat_history=chat_history
-                )
-            elif agent_type == "agentic":
-                agent = create_supervisor_agent(
-                    project_id=project_id,
-                    model="gpt-4o",
-                    chat_history=chat_history
-                )
-
-            if agent:
-                result = agent.invoke({
-                    "messages": [{"role": "user", "content": message_content}]
-                })
-                rag_response_text = result["messages"][-1].content
-                citations = result.get("citations", [])
+        # Project settings (agent_type) and chat history come from send_message_context above
+        agent = None
+        # Agent modules pull in LangChain/LangGraph - imported on first use so other routes don't load them
+        if agent_type == "simple":
+            from src.agents.simple_agent.agent import create_simple_rag_agent
+
+            agent = create_simple_rag_agent(
+                project_id=project_id,
+                model="gpt-4o",
+                chat_history=chat_history
+            )
+        elif agent_type == "agentic":
+            from src.agents.supervisor_agent.agent import create_supervisor_agent
 
-        # Step 5 : Combine Responses
-        final_response = ""
-        
-        # Check if RAG response is just a generic "I don't know" or similar, and if we have a valid CSV response
-        # Check if RAG response is just a generic "I don't know" or similar, and if we have a valid CSV response
-        rag_is_generic = False
-        if rag_response_text:
-             lower_rag = rag_response_text.lower()
-             generic_phrases = [
-                 "project documents do not contain",
-                 "i searched available resources but found no",
-                 "information not present",
-                 "to find this information, you would typically",
-                 "you would typically need to query",
-                 "no relevant chunks found",
-                 "analysis from structured data",
-                 "executed sql"
-             ]
-             if any(phrase in lower_rag for phrase in generic_phrases):
-                 rag_is_generic = True
-                 rag_response_text = "No relevant chunks found"
-
-        if csv_response_text and rag_response_text:
-            final_response = f"**Analysis from Structured Data:**\n{csv_response_text}\n\n**Analysis from Documents:**\n{rag_response_text}"
-        elif csv_response_text:
-            final_response = csv_response_text
-        elif rag_response_text:
-            final_response = rag_response_text
-        else:
-            final_response = "I searched available resources but found no relevant information or experienced an error."
-
-        # Insert AI Response
-        ai_response_insert_data = {
-            "content": final_response,
-            "chat_id": chat_id,
-            "clerk_id": current_user_clerk_id,
-            "role": MessageRole.ASSISTANT.value,
-            "citations": citations,
-        }
+            agent = create_supervisor_agent(
+                project_id=project_id,
+                model="gpt-4o",
+                chat_history=chat_history
+            )
 
-        ai_response_creation_result = (
-            supabase.table("messages").insert(ai_response_insert_data).execute()
-        )
-        if not ai_response_creation_result.data:
-            raise HTTPException(status_code=422, detail="Failed to create AI response")
+        async def generate_response(events: asyncio.Queue):
+            csv_response_text = ""
+            rag_response_text = ""
+            citations = [] # RAG only mostly
 
-        return {
-            "message": "Message created successfully",
-            "data": {
-                "userMessage": message_creation_result.data[0],
-                "aiMessage": ai_response_creation_result.data[0],
-            },
-        }
+            try:
+                if agent:
+                    final_state = {}
+                    async for stream_mode, chunk in agent.astream(
+                        {"messages": [{"role": "user", "content": message_content}]},
+                        stream_mode=["messages", "values"],
+                    ):
+                        if stream_mode == "values":
+                            final_state = chunk
+                            continue
+
+                        token, metadata = chunk
+                        if is_answer_token(token, metadata):
+                            await events.put(sse_event({"type": "token", "content": token.content}))
+
+                    if final_state.get("messages"):
+                        rag_response_text = final_state["messages"][-1].content
+                    citations = final_state.get("citations", [])
+
+                if structured_answer_task:
+                    csv_response_text = await structured_answer_task
+
+                # Step 5 : Combine Responses
+                final_response = ""
+
+                # Check if RAG response is just a generic "I don't know" or similar, and if we have a valid CSV response
+                if rag_response_text and GENERIC_RAG_RESPONSE_RE.search(rag_response_text):
+                    rag_response_text = "No relevant chunks found"
+
+                if csv_response_text and rag_response_text:
+                    final_response = f"**Analysis from Structured Data:**\n{csv_response_text}\n\n**Analysis from Documents:**\n{rag_response_text}"
+                elif csv_response_text:
+                    final_response = csv_response_text
+                elif rag_response_text:
+                    final_response = rag_response_text
+                else:
+                    final_response = "I searched available resources but found no relevant information or experienced an error."
+
+                # Insert AI Response once the stream is complete
+                ai_response_insert_data = {
+                    "content": final_response,
+                    "chat_id": chat_id,
+                    "clerk_id": current_user_clerk_id,
+                    "role": MessageRole.ASSISTANT.value,
+                    "citations": citations,
+                }
+
+                ai_response_creation_result = (
+                    await async_supabase.table("messages").insert(ai_response_insert_data).execute()
+                )
+                if not ai_response_creation_result.data:
+                    await events.put(sse_event({"type": "error", "content": "Failed to create AI response"}))
+                    return
+
+                await events.put(sse_event({
+                    "type": "message",
+                    "message": "Message created successfully",
+                    "data": {
+                        "userMessage": message_creation_result.data[0],
+                        "aiMessage": ai_response_creation_result.data[0],
+                    },
+                }))
+
+            except Exception as e:
+                await events.put(sse_event({
+                    "type": "error",
+                    "content": f"An internal server error occurred while creating message: {str(e)}",
+                }))
+
+            finally:
+                # The RAG pipeline failed - don't leave the structured pipeline running
+                if structured_answer_task and not structured_answer_task.done():
+                    structured_answer_task.cancel()
+                await events.put(None)
+
+        async def event_stream():
+            # Generation and the insert run in their own task: a client disconnect stops forwarding, not saving
+            events: asyncio.Queue = asyncio.Queue()
+            response_task = asyncio.create_task(generate_response(events))
+            response_tasks.add(response_task)
+            response_task.add_done_callback(response_tasks.discard)
+
+            while (event := await events.get()) is not None:
+                yield event
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
 
     except HTTPException as e:
         raise e
@@ -1,15 +1,51 @@
+import logging
+import queue
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.routes.userRoutes import router as userRoutes
 from src.routes.projectRoutes import router as projectRoutes
 from src.routes.projectFilesRoutes import router as projectFilesRoutes
 from src.routes.chatRoutes import router as chatRoutes
+from src.services.redisCache import redis_client
+from src.config.index import appConfig
+
+
+# Application logging (all `src.*` module loggers): records are handed to a queue and written to a
+# size-capped file by a background thread, so request handlers never block on file I/O.
+# DEBUG traces are only emitted when the DEBUG env var is set.
+log_queue = queue.SimpleQueue()
+log_file_handler = RotatingFileHandler(
+    "debug_log.txt", maxBytes=10_000_000, backupCount=3, delay=True
+)
+log_file_handler.setFormatter(
+    logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+)
+log_listener = QueueListener(log_queue, log_file_handler)
+
+app_logger = logging.getLogger("src")
+app_logger.setLevel(logging.DEBUG if appConfig["debug"] else logging.INFO)
+app_logger.propagate = False
+app_logger.addHandler(QueueHandler(log_queue))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background writer for the application log
+    log_listener.start()
+    yield
+    # Release the shared Redis pool on shutdown
+    await redis_client.aclose()
+    log_listener.stop()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Nexora Bot API",
     description="Backend API for Nexora Bot application",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
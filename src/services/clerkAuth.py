@@ -1,4 +1,10 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+from cachetools import TTLCache
 from src.config.index import appConfig
+from src.services.redisCache import redis_client
 from fastapi import Request, HTTPException
 
 from clerk_backend_api import Clerk
@@ -8,77 +14,165 @@ from clerk_backend_api.security.types import AuthenticateRequestOptions
 
 
 
+# Debug trace - handlers and level (DEBUG env var) are configured once in src/server.py
+logger = logging.getLogger(__name__)
+
 # Initialize SDK globally to allow internal caching (e.g. JWKS)
 clerk_sdk = Clerk(bearer_auth=appConfig["clerk_secret_key"])
 
-# Simple in-memory cache: token -> (clerk_id, timestamp)
-token_cache = {}
+# Bounded in-memory cache (L1): sha256(token) -> clerk_id (entries expire after CACHE_TTL)
+# Only touched from the event loop, so no lock is needed
 CACHE_TTL = 60  # Cache duration in seconds
+CACHE_MAX_SIZE = 10_000
+token_cache = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+
+# Shared Redis cache (L2) so verifications are reused across workers and restarts.
+# Only the clerk_id is stored, kept just under the JWT expiry.
+REDIS_CACHE_PREFIX = "auth:"
+REDIS_CACHE_TTL = 55  # Cache duration in seconds (upper bound)
+REDIS_CACHE_EXPIRY_MARGIN = 5  # Seconds to stay below the token's exp claim
+# After a Redis error, skip it for this long so each auth miss doesn't wait on connect timeouts
+REDIS_FAILURE_BACKOFF = 30  # Seconds
+redis_unavailable_until = 0.0
+
+# Single-flight: sha256(token) -> task of the verification currently running for that token
+inflight_verifications: Dict[str, asyncio.Task] = {}
 
 import time
 
-def get_current_user_clerk_id(request: Request):
-    start = time.time()
-    try:
-        # Check cache first
-        auth_header = request.headers.get("Authorization")
-        
-        with open("auth_debug.log", "a") as f:
-            f.write(f"DEBUG: Auth Header present: {bool(auth_header)}\n")
 
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            if token in token_cache:
-                cached_clerk_id, timestamp = token_cache[token]
-                if time.time() - timestamp < CACHE_TTL:
-                    print(f"[Profiling] Cache hit! Took: {time.time() - start}s")
-                    return cached_clerk_id
-                else:
-                    del token_cache[token] # Expired
-
-        # request_state = JWT Token
-        request_state = clerk_sdk.authenticate_request(
-            request,
-            options=AuthenticateRequestOptions(authorized_parties=appConfig["domain"]),
-        )
+def token_cache_key(token: str) -> str:
+    # Hash so raw bearer tokens are never retained in memory
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def verify_request(request: Request) -> Tuple[str, Optional[int]]:
+    """
+    Verify the request's JWT with the Clerk SDK and return the clerk_id and token expiry (blocking - run in a thread).
+    """
+    # request_state = JWT Token
+    request_state = clerk_sdk.authenticate_request(
+        request,
+        options=AuthenticateRequestOptions(authorized_parties=appConfig["domain"]),
+    )
+
+    if not request_state.is_signed_in:
+        raise HTTPException(status_code=401, detail="User is not signed in")
+
+    clerk_id = request_state.payload.get("sub")
+
+    if not clerk_id:
+        raise HTTPException(status_code=401, detail="Clerk ID not found in token")
+
+    return clerk_id, request_state.payload.get("exp")
 
-        if not request_state.is_signed_in:
-            raise HTTPException(status_code=401, detail="User is not signed in")
 
-        clerk_id = request_state.payload.get("sub")
+def redis_available() -> bool:
+    return time.monotonic() >= redis_unavailable_until
 
-        if not clerk_id:
-            raise HTTPException(status_code=401, detail="Clerk ID not found in token")
 
-        # Update cache
+def mark_redis_unavailable(operation: str, error: Exception):
+    global redis_unavailable_until
+    redis_unavailable_until = time.monotonic() + REDIS_FAILURE_BACKOFF
+    logger.warning(
+        "Auth Redis cache %s failed, skipping Redis for %ss: %s",
+        operation, REDIS_FAILURE_BACKOFF, str(error),
+    )
+
+
+async def get_shared_clerk_id(token_hash: str) -> Optional[str]:
+    # Redis is an optimisation only - on any failure fall back to verifying the token
+    if not redis_available():
+        return None
+    try:
+        cached_clerk_id = await redis_client.get(REDIS_CACHE_PREFIX + token_hash)
+    except Exception as e:
+        mark_redis_unavailable("read", e)
+        return None
+    return cached_clerk_id.decode() if cached_clerk_id else None
+
+
+async def set_shared_clerk_id(token_hash: str, clerk_id: str, expires_at: Optional[int]):
+    ttl = REDIS_CACHE_TTL
+    if expires_at:
+        ttl = min(ttl, int(expires_at - time.time()) - REDIS_CACHE_EXPIRY_MARGIN)
+    if ttl <= 0 or not redis_available():
+        return
+    try:
+        await redis_client.setex(REDIS_CACHE_PREFIX + token_hash, ttl, clerk_id)
+    except Exception as e:
+        mark_redis_unavailable("write", e)
+
+
+async def verify_and_cache(request: Request, token_hash: str) -> str:
+    clerk_id = await get_shared_clerk_id(token_hash)
+    if not clerk_id:
+        clerk_id, expires_at = await asyncio.to_thread(verify_request, request)
+        await set_shared_clerk_id(token_hash, clerk_id, expires_at)
+    token_cache[token_hash] = clerk_id
+    return clerk_id
+
+
+def finish_verification(token_hash: str, task: asyncio.Task):
+    if inflight_verifications.get(token_hash) is task:
+        inflight_verifications.pop(token_hash)
+    # Mark the exception as retrieved when nobody else was waiting on it
+    if not task.cancelled():
+        task.exception()
+
+
+async def verify_request_once(request: Request, token_hash: str) -> str:
+    """
+    Verify the request, sharing one verification between concurrent requests carrying the same token.
+    Checks the shared Redis cache before falling back to the Clerk SDK.
+    """
+    # No await between the lookup and the insert, so this check-and-set is atomic on the event loop
+    task = inflight_verifications.get(token_hash)
+    if task is None:
+        # Own task, shielded below, so a disconnecting first caller doesn't cancel it for the waiters
+        task = asyncio.create_task(verify_and_cache(request, token_hash))
+        task.add_done_callback(lambda t: finish_verification(token_hash, t))
+        inflight_verifications[token_hash] = task
+    return await asyncio.shield(task)
+
+
+async def get_current_user_clerk_id(request: Request):
+    try:
+        # Check cache first
+        auth_header = request.headers.get("Authorization")
+
+        logger.debug("Auth Header present: %s", bool(auth_header))
+
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
-            token_cache[token] = (clerk_id, time.time())
+            token_hash = token_cache_key(token)
+            cached_clerk_id = token_cache.get(token_hash)
+            if cached_clerk_id:
+                return cached_clerk_id
+
+            clerk_id = await verify_request_once(request, token_hash)
+        else:
+            clerk_id, _ = await asyncio.to_thread(verify_request, request)
 
-        end = time.time()
-        print(f"[Profiling] Clerk Auth (Miss) took: {end - start}s")
-        with open("auth_debug.log", "a") as f:
-             f.write(f"DEBUG: Auth Success. Clerk ID: {clerk_id}\n")
+        logger.debug("Auth Success. Clerk ID: %s", clerk_id)
         return clerk_id
 
     except HTTPException as e:
-        with open("auth_debug.log", "a") as f:
-             f.write(f"DEBUG: Auth HTTPException: {e.detail}\n")
+        logger.debug("Auth HTTPException: %s", e.detail)
         raise e
 
     except Exception as e:
         # Check for "HTTPException-like" objects (duck typing)
-        # This handles cases where the exception class might verify as different 
+        # This handles cases where the exception class might verify as different
         # due to reloading or different import paths, but strictly has the same structure.
         if hasattr(e, "status_code") and hasattr(e, "detail"):
              raise HTTPException(
                 status_code=e.status_code,
                 detail=e.detail
             )
-            
+
         print(f"Clerk Auth Error: {str(e)}")
-        with open("auth_debug.log", "a") as f:
-             f.write(f"DEBUG: Clerk Auth Error: {str(e)}\n")
+        logger.debug("Clerk Auth Error: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Clerk SDK Failed. {str(e)}",
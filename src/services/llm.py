@@ -1,19 +1,38 @@
+import httpx
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from src.config.index import appConfig
 
+# Process-wide keep-alive HTTP/2 pools shared by every OpenAI client, so the TCP/TLS handshake
+# to the API is paid once per connection instead of once per agent/request
+_openai_http_limits = httpx.Limits(max_keepalive_connections=20)
+openai_http_client = httpx.Client(http2=True, limits=_openai_http_limits)
+openai_http_async_client = httpx.AsyncClient(http2=True, limits=_openai_http_limits)
+
+_chat_models: dict[str, ChatOpenAI] = {}
+
+
+def get_chat_model(model: str = "gpt-4o") -> ChatOpenAI:
+    """Returns the shared temperature=0 ChatOpenAI instance for a model (created on first use)."""
+    if model not in _chat_models:
+        _chat_models[model] = ChatOpenAI(
+            model=model,
+            api_key=appConfig["openai_api_key"],
+            temperature=0,
+            http_client=openai_http_client,
+            http_async_client=openai_http_async_client,
+        )
+    return _chat_models[model]
+
+
 openAI = {
-    "embeddings_llm": ChatOpenAI(
-        model="gpt-4o", api_key=appConfig["openai_api_key"], temperature=0
-    ),
+    "embeddings_llm": get_chat_model("gpt-4o"),
     "embeddings": OpenAIEmbeddings(
         model="text-embedding-3-large",
         api_key=appConfig["openai_api_key"],
         dimensions=1536,  # ! Do not changes this value. It is used in the document_chunks embedding vector.
+        http_client=openai_http_client,
+        http_async_client=openai_http_async_client,
     ),
-    "chat_llm": ChatOpenAI(
-        model="gpt-4o", api_key=appConfig["openai_api_key"], temperature=0
-    ),
-    "mini_llm": ChatOpenAI(
-        model="gpt-4o-mini", api_key=appConfig["openai_api_key"], temperature=0
-    ),
+    "chat_llm": get_chat_model("gpt-4o"),
+    "mini_llm": get_chat_model("gpt-4o-mini"),
 }
@@ -0,0 +1,54 @@
+import json
+import logging
+from typing import Any, Optional
+from redis.asyncio import Redis
+from src.config.index import appConfig
+
+# Shared async Redis pool for API-side caches (auth, settings, projects).
+# Closed in the FastAPI lifespan (src/server.py).
+redis_client: Redis = Redis.from_url(
+    appConfig["redis_url"],
+    max_connections=50,
+    socket_timeout=2,
+    socket_connect_timeout=2,
+)
+
+logger = logging.getLogger(__name__)
+
+# Cache keys. Always scoped by clerk_id so one user's cached response is never served to another.
+PROJECT_SETTINGS_CACHE_KEY = "psettings:{project_id}:{current_user_clerk_id}"
+PROJECT_SETTINGS_CACHE_TTL = 3600  # Cache duration in seconds
+PROJECTS_CACHE_KEY = "projects:{current_user_clerk_id}"
+PROJECTS_CACHE_TTL = 300  # Cache duration in seconds
+
+
+async def get_cached_response(key: str) -> Optional[Any]:
+    """
+    Cache-aside read of a JSON route response. Returns None on a miss or if Redis is unavailable.
+
+    Responses are cached server-side only (no HTTP caching headers), so clients see an
+    invalidation on their very next request.
+    """
+    try:
+        cached_response = await redis_client.get(key)
+    except Exception as e:
+        logger.warning("Cache read failed for key %s: %s", key, str(e))
+        return None
+    return json.loads(cached_response) if cached_response else None
+
+
+async def set_cached_response(key: str, response: Any, expire: int):
+    try:
+        await redis_client.setex(key, expire, json.dumps(response, default=str))
+    except Exception as e:
+        logger.warning("Cache write failed for key %s: %s", key, str(e))
+
+
+async def invalidate_cache(key: str):
+    """
+    Drop a cached response after a write. Failures are logged - the entry still expires on its own.
+    """
+    try:
+        await redis_client.delete(key)
+    except Exception as e:
+        logger.warning("Failed to invalidate cache key %s: %s", key, str(e))
@@ -1,6 +1,28 @@
-from supabase import Client, create_client
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, Client, ClientOptions, create_client
 from src.config.index import appConfig
 
+# Shared keep-alive HTTP/2 pools, so Supabase calls reuse TCP/TLS connections across requests.
+# Bounded so bursts queue for a connection instead of opening unbounded sockets; idle connections
+# are recycled before load balancers/proxies silently drop them.
+_http_limits = httpx.Limits(
+    max_connections=120, max_keepalive_connections=80, keepalive_expiry=30
+)
+_http_timeout = httpx.Timeout(30)
+
 supabase: Client = create_client(
-    appConfig["supabase_api_url"], appConfig["supabase_secret_key"]
+    appConfig["supabase_api_url"],
+    appConfig["supabase_secret_key"],
+    options=ClientOptions(
+        httpx_client=httpx.Client(http2=True, limits=_http_limits, timeout=_http_timeout)
+    ),
+)
+
+# Async client for route handlers - awaiting it keeps the event loop free during round trips
+async_supabase: AsyncClient = AsyncClient(
+    appConfig["supabase_api_url"],
+    appConfig["supabase_secret_key"],
+    options=AsyncClientOptions(
+        httpx_client=httpx.AsyncClient(http2=True, limits=_http_limits, timeout=_http_timeout)
+    ),
 )
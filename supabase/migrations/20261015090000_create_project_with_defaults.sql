@@ -0,0 +1,50 @@
+-- Create a project together with its default settings in a single transaction.
+-- Replaces the "insert project, insert settings, delete project on failure" sequence in create_project.
+
+CREATE OR REPLACE FUNCTION create_project_with_defaults(
+    p_name text,
+    p_description text,
+    p_clerk_id text
+)
+RETURNS projects
+LANGUAGE plpgsql
+AS $function$
+DECLARE
+    new_project projects;
+BEGIN
+    INSERT INTO projects (name, description, clerk_id)
+    VALUES (p_name, p_description, p_clerk_id)
+    RETURNING * INTO new_project;
+
+    INSERT INTO project_settings (
+        project_id,
+        embedding_model,
+        rag_strategy,
+        agent_type,
+        chunks_per_search,
+        final_context_size,
+        similarity_threshold,
+        number_of_queries,
+        reranking_enabled,
+        reranking_model,
+        vector_weight,
+        keyword_weight
+    )
+    VALUES (
+        new_project.id,
+        'text-embedding-3-large',
+        'basic',
+        'agentic',
+        10,
+        5,
+        0.3,
+        5,
+        true,
+        'reranker-english-v3.0',
+        0.7,
+        0.3
+    );
+
+    RETURN new_project;
+END;
+$function$;
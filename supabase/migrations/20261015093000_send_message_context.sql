@@ -0,0 +1,51 @@
+-- Everything send_message needs after inserting the user message, in one round trip:
+--   docs     - completed project documents (id, filename, s3_key, processing_status)
+--   settings - project settings, only when the project belongs to p_clerk_id (null otherwise)
+--   history  - last p_history_limit messages of the chat (excluding p_exclude), oldest first
+
+CREATE OR REPLACE FUNCTION send_message_context(
+    p_project_id uuid,
+    p_chat_id uuid,
+    p_exclude uuid,
+    p_clerk_id text,
+    p_history_limit integer DEFAULT 10
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT jsonb_build_object(
+    'docs', COALESCE((
+        SELECT jsonb_agg(jsonb_build_object(
+            'id', pd.id,
+            'filename', pd.filename,
+            's3_key', pd.s3_key,
+            'processing_status', pd.processing_status
+        ))
+        FROM project_documents pd
+        WHERE pd.project_id = p_project_id
+          AND pd.processing_status = 'completed'
+    ), '[]'::jsonb),
+    'settings', (
+        SELECT to_jsonb(ps)
+        FROM project_settings ps
+        JOIN projects p ON p.id = ps.project_id
+        WHERE ps.project_id = p_project_id
+          AND p.clerk_id = p_clerk_id
+    ),
+    'history', COALESCE((
+        SELECT jsonb_agg(jsonb_build_object(
+            'role', COALESCE(h.role, 'user'),
+            'content', h.content
+        ) ORDER BY h.created_at ASC)
+        FROM (
+            SELECT m.role, m.content, m.created_at
+            FROM messages m
+            WHERE m.chat_id = p_chat_id
+              AND m.id IS DISTINCT FROM p_exclude
+            ORDER BY m.created_at DESC
+            LIMIT p_history_limit
+        ) h
+    ), '[]'::jsonb)
+);
+$function$;
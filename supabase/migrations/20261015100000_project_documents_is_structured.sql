@@ -0,0 +1,68 @@
+-- Classify documents as structured (CSV/Excel) in the database, so callers can filter instead of
+-- fetching every document and checking the filename suffix in Python.
+
+ALTER TABLE project_documents
+    ADD COLUMN IF NOT EXISTS is_structured boolean
+    GENERATED ALWAYS AS (lower(filename) ~ '\.(csv|xlsx|xls)$') STORED;
+
+CREATE INDEX IF NOT EXISTS project_documents_project_status_structured_idx
+    ON project_documents (project_id, processing_status, is_structured);
+
+
+-- send_message_context now returns the completed documents already partitioned:
+--   structured   - CSV/Excel files (is_structured)
+--   unstructured - everything else
+--   schema       - JSON schema files for the structured files
+
+CREATE OR REPLACE FUNCTION send_message_context(
+    p_project_id uuid,
+    p_chat_id uuid,
+    p_exclude uuid,
+    p_clerk_id text,
+    p_history_limit integer DEFAULT 10
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $function$
+WITH docs AS (
+    SELECT
+        pd.is_structured,
+        lower(pd.filename) LIKE '%.json' AS is_schema,
+        jsonb_build_object(
+            'id', pd.id,
+            'filename', pd.filename,
+            's3_key', pd.s3_key,
+            'processing_status', pd.processing_status
+        ) AS doc
+    FROM project_documents pd
+    WHERE pd.project_id = p_project_id
+      AND pd.processing_status = 'completed'
+)
+SELECT jsonb_build_object(
+    'structured', COALESCE((SELECT jsonb_agg(doc) FROM docs WHERE is_structured), '[]'::jsonb),
+    'unstructured', COALESCE((SELECT jsonb_agg(doc) FROM docs WHERE NOT is_structured), '[]'::jsonb),
+    'schema', COALESCE((SELECT jsonb_agg(doc) FROM docs WHERE is_schema), '[]'::jsonb),
+    'settings', (
+        SELECT to_jsonb(ps)
+        FROM project_settings ps
+        JOIN projects p ON p.id = ps.project_id
+        WHERE ps.project_id = p_project_id
+          AND p.clerk_id = p_clerk_id
+    ),
+    'history', COALESCE((
+        SELECT jsonb_agg(jsonb_build_object(
+            'role', COALESCE(h.role, 'user'),
+            'content', h.content
+        ) ORDER BY h.created_at ASC)
+        FROM (
+            SELECT m.role, m.content, m.created_at
+            FROM messages m
+            WHERE m.chat_id = p_chat_id
+              AND m.id IS DISTINCT FROM p_exclude
+            ORDER BY m.created_at DESC
+            LIMIT p_history_limit
+        ) h
+    ), '[]'::jsonb)
+);
+$function$;
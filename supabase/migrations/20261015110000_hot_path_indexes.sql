@@ -0,0 +1,17 @@
+-- Indexes for the hot query patterns of the API routes.
+-- Plain CREATE INDEX (not CONCURRENTLY): migrations run inside a transaction.
+-- Already covered elsewhere, so not repeated here:
+--   project_settings(project_id)               - UNIQUE constraint
+--   project_documents(project_id, processing_status) - prefix of project_documents_project_status_structured_idx
+
+-- get_projects / ownership checks: WHERE clerk_id = ?
+CREATE INDEX IF NOT EXISTS projects_clerk_id_idx
+    ON projects (clerk_id);
+
+-- get_project_chats: WHERE project_id = ? AND clerk_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS chats_project_clerk_created_idx
+    ON chats (project_id, clerk_id, created_at DESC);
+
+-- Chat history (send_message_context) and get_chat: WHERE chat_id = ? ORDER BY created_at
+CREATE INDEX IF NOT EXISTS messages_chat_created_idx
+    ON messages (chat_id, created_at DESC);